@@ -26,7 +26,7 @@ from pyinfra.connectors.util import CommandOutput, remove_any_sudo_askpass_file
 from .connectors import get_execution_connector
 from .exceptions import ConnectError
 from .facts import FactBase, ShortFactBase, get_host_fact
-from .util import memoize, sha1_hash
+from .util import blake2b_hash, memoize
 
 if TYPE_CHECKING:
     from pyinfra.api.arguments import AllArguments
@@ -331,7 +331,7 @@ class Host:
             hash_key = str(uuid4())
 
         if hash_filename:
-            hash_key = sha1_hash(hash_key)
+            hash_key = blake2b_hash(hash_key)
 
         return "{0}/pyinfra-{1}".format(temp_directory, hash_key)
 
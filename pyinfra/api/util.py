@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from functools import wraps
-from hashlib import sha1
+from hashlib import blake2b, sha1
 from inspect import getframeinfo, stack
 from io import BytesIO, StringIO
 from os import getcwd, path, stat
@@ -178,6 +178,16 @@ def sha1_hash(string: str) -> str:
     return hasher.hexdigest()
 
 
+def blake2b_hash(string: str) -> str:
+    """
+    Return the 160 bit BLAKE2b of the input string.
+    """
+
+    hasher = blake2b(digest_size=20)
+    hasher.update(string.encode("utf-8"))
+    return hasher.hexdigest()
+
+
 def format_exception(e: Exception) -> str:
     return f"{e.__class__.__name__}{e.args}"
 
@@ -14,7 +14,7 @@ from typing_extensions import TypedDict, Unpack
 from pyinfra import logger
 from pyinfra.api.command import QuoteString, StringCommand
 from pyinfra.api.exceptions import ConnectError
-from pyinfra.api.util import get_file_io, memoize
+from pyinfra.api.util import get_file_io
 
 from .base import BaseConnector, DataMeta
 from .ssh_util import get_private_key, raise_connect_error
@@ -143,6 +143,7 @@ class SSHConnector(BaseConnector):
     data: ConnectorData
 
     client: Optional[SSHClient] = None
+    sftp: Optional[SFTPClient] = None
 
     @staticmethod
     def make_names_data(name):
@@ -265,7 +266,14 @@ class SSHConnector(BaseConnector):
             )
 
     def disconnect(self) -> None:
-        self.get_sftp_connection.cache.clear()
+        if self.sftp is not None:
+            # A dead transport shouldn't stop the remaining hosts disconnecting
+            try:
+                self.sftp.close()
+            except (SSHException, EOFError, OSError) as e:
+                logger.warning(f"Failed to close SFTP session: {e}")
+            finally:
+                self.sftp = None
 
     def run_shell_command(
         self,
@@ -348,13 +356,18 @@ class SSHConnector(BaseConnector):
 
         return status, combined_output
 
-    @memoize
     def get_sftp_connection(self):
+        # One SFTP session per host, opened on first use and reused for all transfers
+        # over the existing SSH transport until disconnect.
+        if self.sftp is not None:
+            return self.sftp
+
         assert self.client is not None
         transport = self.client.get_transport()
         assert transport is not None, "No transport"
         try:
-            return SFTPClient.from_transport(transport)
+            self.sftp = SFTPClient.from_transport(transport)
+            return self.sftp
         except SSHException as e:
             raise ConnectError(
                 (
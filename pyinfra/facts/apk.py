@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import re
+
 from pyinfra.api import FactBase
 
 from .util.packaging import parse_packages
 
-APK_REGEX = r"^([a-zA-Z0-9\-_]+)-([0-9\.]+\-?[a-z0-9]*)\s"
+APK_REGEX = re.compile(
+    # The rest of the line is consumed so scanning resumes straight at the next one
+    r"^([^\s-]+(?:-[^\s-]+)*?)-(\d[^\s-]*(?:-[a-z0-9]+)?)[ \t].*",
+    re.MULTILINE,
+)
 
 
 class ApkPackages(FactBase):
@@ -42,9 +42,11 @@ class DebPackages(FactBase):
 
     default = dict
 
-    regex = r"^[i|h]i\s+({0}):?[a-zA-Z0-9]*\s+({1}).+$".format(
-        DEB_PACKAGE_NAME_REGEX,
-        DEB_PACKAGE_VERSION_REGEX,
+    regex = re.compile(
+        r"^[i|h]i\s+({0}):?[a-zA-Z0-9]*\s+({1}).+$".format(
+            DEB_PACKAGE_NAME_REGEX,
+            DEB_PACKAGE_VERSION_REGEX,
+        ),
     )
 
     def process(self, output):
@@ -56,10 +58,13 @@ class DebPackage(FactBase):
     Returns information on a .deb archive or installed package.
     """
 
-    _regexes = {
-        "name": r"^Package:\s+({0})$".format(DEB_PACKAGE_NAME_REGEX),
-        "version": r"^Version:\s+({0})$".format(DEB_PACKAGE_VERSION_REGEX),
-    }
+    # Single pattern for both fields, the matched named group says which one a line holds
+    _regex = re.compile(
+        r"^(?:Package:\s+(?P<name>{0})|Version:\s+(?P<version>{1}))$".format(
+            DEB_PACKAGE_NAME_REGEX,
+            DEB_PACKAGE_VERSION_REGEX,
+        ),
+    )
 
     def requires_command(self, package) -> str:
         return "dpkg"
@@ -73,12 +78,8 @@ class DebPackage(FactBase):
         data = {}
 
         for line in output:
-            line = line.strip()
-            for key, regex in self._regexes.items():
-                matches = re.match(regex, line)
-                if matches:
-                    value = matches.group(1)
-                    data[key] = value
-                    break
+            matches = self._regex.match(line.strip())
+            if matches and matches.lastgroup:
+                data[matches.lastgroup] = matches.group(matches.lastgroup)
 
         return data
@@ -7,7 +7,7 @@ from pyinfra.api import FactBase
 
 from .util.packaging import parse_packages
 
-rpm_regex = r"^(\S+)\ (\S+)$"
+rpm_regex = re.compile(r"^(\S+)\ (\S+)$", re.MULTILINE)
 rpm_query_format = "%{NAME} %{VERSION}-%{RELEASE}\\n"
 
 
@@ -58,7 +58,7 @@ class RpmPackage(FactBase):
 
     def process(self, output):
         for line in output:
-            matches = re.match(rpm_regex, line)
+            matches = rpm_regex.match(line)
             if matches:
                 return {
                     "name": matches.group(1),
@@ -87,7 +87,7 @@ class RpmPackageProvides(FactBase):
         packages = []
 
         for line in output:
-            matches = re.match(rpm_regex, line)
+            matches = rpm_regex.match(line)
             if matches:
                 packages.append(list(matches.groups()))
 
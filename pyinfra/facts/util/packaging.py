@@ -1,20 +1,112 @@
 from __future__ import annotations
 
 import re
-from typing import Iterable
-
-
-def parse_packages(regex: str, output: Iterable[str]) -> dict[str, set[str]]:
-    packages: dict[str, set[str]] = {}
+import sys
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import FrozenSet, Iterable, Iterator, Mapping, Pattern, Union
+
+
+class PackagesView(Mapping[str, FrozenSet[str]]):
+    """
+    Read-only mapping of package name -> versions, stored as flat tuples rather than a set
+    per package, keeping the order packages were first seen in. Used to hold parsed
+    package listings that are kept around and shared between hosts.
+    """
+
+    __slots__ = ("_names", "_versions", "_unique_names")
+
+    def __init__(self, packages: Mapping[str, Iterable[str]]):
+        unique_names: list[str] = []
+        # One name per version, grouped by package
+        names: list[str] = []
+        versions: list[str] = []
+
+        for name, package_versions in packages.items():
+            # Package names repeat across hosts (versions much less so), intern them so
+            # every parse shares the same string objects.
+            name = sys.intern(name)
+            unique_names.append(name)
+            for version in package_versions:
+                names.append(name)
+                versions.append(version)
+
+        self._unique_names = tuple(unique_names)
+        self._names = tuple(names)
+        self._versions = tuple(versions)
+
+    def __getitem__(self, name: str) -> FrozenSet[str]:
+        # Lookups scan the names, views are meant to be stored and copied out with to_dict
+        try:
+            start = self._names.index(name)
+        except ValueError:
+            raise KeyError(name) from None
+
+        end = start + 1
+        while end < len(self._names) and self._names[end] == name:
+            end += 1
+        return frozenset(self._versions[start:end])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._unique_names)
+
+    def __len__(self) -> int:
+        return len(self._unique_names)
+
+    def to_dict(self) -> dict[str, set[str]]:
+        packages: dict[str, set[str]] = {}
+        for name, version in zip(self._names, self._versions):
+            packages.setdefault(name, set()).add(version)
+        return packages
+
+
+# Parsed listings keyed by pattern and a digest of the output, so entries don't keep the
+# (often large) output itself alive.
+PACKAGES_CACHE_SIZE = 128
+_packages_cache: OrderedDict[tuple[Pattern[str], bytes], PackagesView] = OrderedDict()
+
+
+def parse_packages(
+    regex: Union[str, Pattern[str]],
+    output: Iterable[str],
+) -> dict[str, set[str]]:
+    if isinstance(regex, str):
+        regex = re.compile(regex)
+
+    lines = list(output)
+    buffer = "\n".join(lines)
+
+    # Identical output (common across a fleet of similar hosts) is only parsed once, each
+    # caller still gets its own copy to mutate.
+    key = (regex, blake2b(buffer.encode(), digest_size=16).digest())
+    cached_packages = _packages_cache.get(key)
+    if cached_packages is not None:
+        _packages_cache.move_to_end(key)
+        return cached_packages.to_dict()
+
+    packages = _scan_packages(regex, lines, buffer)
+    _packages_cache[key] = PackagesView(packages)
+    if len(_packages_cache) > PACKAGES_CACHE_SIZE:
+        _packages_cache.popitem(last=False)
+    return packages
 
-    for line in output:
-        matches = re.match(regex, line)
 
-        if matches:
-            name = matches.group(1)
-            packages.setdefault(name, set())
-            packages[name].add(matches.group(2))
+def _scan_packages(regex: Pattern[str], lines: list[str], buffer: str) -> dict[str, set[str]]:
+    # Multiline patterns scan the whole output in one pass rather than line by line
+    if regex.flags & re.MULTILINE:
+        # With only the name & version groups findall builds the pairs directly in C,
+        # skipping the per match object and group calls.
+        if regex.groups == 2:
+            pairs = regex.findall(buffer)
+        else:
+            pairs = [(matches.group(1), matches.group(2)) for matches in regex.finditer(buffer)]
+    else:
+        matches_iter = filter(None, (regex.match(line) for line in lines))
+        pairs = [(matches.group(1), matches.group(2)) for matches in matches_iter]
 
+    packages: dict[str, set[str]] = {}
+    for name, version in pairs:
+        packages.setdefault(name, set()).add(version)
     return packages
 
 
@@ -96,8 +96,17 @@ class FakeSFTPClient:
     def getfo(self, remote_location, file_io):
         pass
 
+    def close(self):
+        pass
+
 
 class FakeRSAKey:
+    # Fake keys hold no state so every "loaded" key file can share the one instance
+    shared_instance: "FakeRSAKey"
+
     @classmethod
     def from_private_key_file(cls, *args, **kwargs):
-        return cls()
+        return cls.shared_instance
+
+
+FakeRSAKey.shared_instance = FakeRSAKey()
@@ -2,23 +2,70 @@
 
 from socket import error as socket_error, gaierror
 from unittest import TestCase
-from unittest.mock import MagicMock, call, mock_open, patch
+from unittest.mock import DEFAULT, MagicMock, call, mock_open, patch
 
 from paramiko import AuthenticationException, PasswordRequiredException, SSHException
 
 import pyinfra
-from pyinfra.api import Config, MaskString, State, StringCommand
+from pyinfra.api import MaskString, StringCommand
 from pyinfra.api.connect import connect_all
+from pyinfra.api.connectors import get_all_connectors, get_execution_connectors
 from pyinfra.api.exceptions import ConnectError, PyinfraError
+from pyinfra.connectors.sshuserclient import SSHClient
 
-from ..util import make_inventory
+from ..util import make_state
 
+# Attribute names only, so specced mocks skip introspecting the client class each time
+SSH_CLIENT_SPEC = dir(SSHClient)
 
-def make_raise_exception_function(cls, *args, **kwargs):
-    def handler(*a, **kw):
-        raise cls(*args, **kwargs)
 
-    return handler
+def make_stdout_mock(exit_status):
+    stdout_mock = MagicMock()
+    stdout_mock.channel.recv_exit_status.return_value = exit_status
+    return stdout_mock
+
+
+def require_key_password(*args, **kwargs):
+    # Key loaded only when a password is passed, returning the mock's return_value
+    if "password" not in kwargs:
+        raise PasswordRequiredException
+    return DEFAULT
+
+
+def reject_key_password(*args, **kwargs):
+    if "password" not in kwargs:
+        raise PasswordRequiredException
+    raise SSHException
+
+
+# Started in setUpModule & stopped in tearDownModule
+connector_patches = []
+
+
+def setUpModule():
+    # Inventories (and their hosts) are bound to the state of each test so can't be shared,
+    # but the connector entry point lookup they trigger can be done once. Resolved here
+    # rather than at import so collecting the tests stays cheap.
+    connector_patches.extend(
+        [
+            patch(
+                "pyinfra.api.inventory.get_all_connectors",
+                return_value=get_all_connectors(),
+            ),
+            patch(
+                "pyinfra.api.inventory.get_execution_connectors",
+                return_value=get_execution_connectors(),
+            ),
+        ],
+    )
+    for connector_patch in connector_patches:
+        connector_patch.start()
+
+
+def tearDownModule():
+    for connector_patch in connector_patches:
+        connector_patch.stop()
+    connector_patches.clear()
 
 
 @patch("pyinfra.connectors.ssh.SSHClient.get_transport", MagicMock())
@@ -32,26 +79,23 @@ class TestSSHConnector(TestCase):
         self.fake_connect_patch.stop()
 
     def test_connect_all(self):
-        inventory = make_inventory()
-        state = State(inventory, Config())
+        state = make_state()
         connect_all(state)
         assert len(state.active_hosts) == 2
 
     def test_connect_host(self):
-        inventory = make_inventory()
-        state = State(inventory, Config())
-        host = inventory.get_host("somehost")
+        state = make_state()
+        host = state.inventory.get_host("somehost")
         host.connect(reason=True)
         assert len(state.active_hosts) == 0
 
     def test_connect_all_password(self):
-        inventory = make_inventory(override_data={"ssh_password": "test"})
+        state = make_state(override_data={"ssh_password": "test"})
 
         # Get a host
-        somehost = inventory.get_host("somehost")
+        somehost = state.inventory.get_host("somehost")
         assert somehost.data.ssh_password == "test"
 
-        state = State(inventory, Config())
         connect_all(state)
 
         assert len(state.active_hosts) == 2
@@ -59,6 +103,10 @@ class TestSSHConnector(TestCase):
     @patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True)
     @patch("pyinfra.connectors.ssh_util.RSAKey.from_private_key_file")
     def test_connect_exceptions(self, fake_key_open):
+        # Failed connections leave the hosts untouched so one state can be reused, only
+        # resetting the host sets connect_all updates.
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
+
         for exception_class in (
             AuthenticationException,
             SSHException,
@@ -66,20 +114,22 @@ class TestSSHConnector(TestCase):
             socket_error,
             EOFError,
         ):
-            state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+            with self.subTest(exception_class=exception_class):
+                state.active_hosts = set()
+                state.failed_hosts = set()
 
-            self.fake_connect_mock.side_effect = make_raise_exception_function(exception_class)
+                self.fake_connect_mock.side_effect = exception_class
 
-            with self.assertRaises(PyinfraError):
-                connect_all(state)
+                with self.assertRaises(PyinfraError):
+                    connect_all(state)
 
-            assert len(state.active_hosts) == 0
+                assert len(state.active_hosts) == 0
 
     # SSH key tests
     #
 
     def test_connect_with_rsa_ssh_key(self):
-        state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
@@ -110,33 +160,22 @@ class TestSSHConnector(TestCase):
             )
 
         # Check that loading the same key again is cached in the state
-        second_state = State(
-            make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)),
-            Config(),
-        )
+        second_state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
         second_state.private_keys = state.private_keys
 
         connect_all(second_state)
 
     def test_connect_with_rsa_ssh_key_password(self):
-        state = State(
-            make_inventory(
-                hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
-            ),
-            Config(),
+        state = make_state(
+            hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
         )
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
         ) as fake_key_open:
             fake_key = MagicMock()
-
-            def fake_key_open_fail(*args, **kwargs):
-                if "password" not in kwargs:
-                    raise PasswordRequiredException()
-                return fake_key
-
-            fake_key_open.side_effect = fake_key_open_fail
+            fake_key_open.side_effect = require_key_password
+            fake_key_open.return_value = fake_key
 
             connect_all(state)
 
@@ -146,7 +185,7 @@ class TestSSHConnector(TestCase):
             fake_key.load_certificate.assert_called_with("testkey.pub")
 
     def test_connect_with_rsa_ssh_key_password_from_prompt(self):
-        state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.getpass",
@@ -155,13 +194,8 @@ class TestSSHConnector(TestCase):
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
         ) as fake_key_open:
             fake_key = MagicMock()
-
-            def fake_key_open_fail(*args, **kwargs):
-                if "password" not in kwargs:
-                    raise PasswordRequiredException()
-                return fake_key
-
-            fake_key_open.side_effect = fake_key_open_fail
+            fake_key_open.side_effect = require_key_password
+            fake_key_open.return_value = fake_key
 
             pyinfra.is_cli = True
             connect_all(state)
@@ -173,12 +207,12 @@ class TestSSHConnector(TestCase):
             fake_key.load_certificate.assert_called_with("testkey.pub")
 
     def test_connect_with_rsa_ssh_key_missing_password(self):
-        state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
         ) as fake_key_open:
-            fake_key_open.side_effect = make_raise_exception_function(PasswordRequiredException)
+            fake_key_open.side_effect = PasswordRequiredException
 
             fake_key = MagicMock()
             fake_key_open.return_value = fake_key
@@ -191,15 +225,12 @@ class TestSSHConnector(TestCase):
             )
 
     def test_connect_with_rsa_ssh_key_wrong_password(self):
-        state = State(
-            make_inventory(
-                hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
-            ),
-            Config(),
+        state = make_state(
+            hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
         )
 
         fake_fail_from_private_key_file = MagicMock()
-        fake_fail_from_private_key_file.side_effect = make_raise_exception_function(SSHException)
+        fake_fail_from_private_key_file.side_effect = SSHException
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.DSSKey.from_private_key_file",
@@ -213,13 +244,7 @@ class TestSSHConnector(TestCase):
         ), patch(
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
         ) as fake_key_open:
-
-            def fake_key_open_fail(*args, **kwargs):
-                if "password" not in kwargs:
-                    raise PasswordRequiredException
-                raise SSHException
-
-            fake_key_open.side_effect = fake_key_open_fail
+            fake_key_open.side_effect = reject_key_password
 
             fake_key = MagicMock()
             fake_key_open.return_value = fake_key
@@ -232,14 +257,14 @@ class TestSSHConnector(TestCase):
         assert fake_fail_from_private_key_file.call_count == 3
 
     def test_connect_with_dss_ssh_key(self):
-        state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
             "pyinfra.connectors.ssh_util.RSAKey.from_private_key_file",
         ) as fake_rsa_key_open, patch(
             "pyinfra.connectors.ssh_util.DSSKey.from_private_key_file",
         ) as fake_key_open:  # noqa
-            fake_rsa_key_open.side_effect = make_raise_exception_function(SSHException)
+            fake_rsa_key_open.side_effect = SSHException
 
             fake_key = MagicMock()
             fake_key_open.return_value = fake_key
@@ -265,20 +290,14 @@ class TestSSHConnector(TestCase):
             )
 
         # Check that loading the same key again is cached in the state
-        second_state = State(
-            make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)),
-            Config(),
-        )
+        second_state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
         second_state.private_keys = state.private_keys
 
         connect_all(second_state)
 
     def test_connect_with_dss_ssh_key_password(self):
-        state = State(
-            make_inventory(
-                hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
-            ),
-            Config(),
+        state = make_state(
+            hosts=(("somehost", {"ssh_key": "testkey", "ssh_key_password": "testpass"}),),
         )
 
         with patch("pyinfra.connectors.ssh_util.path.isfile", lambda *args, **kwargs: True), patch(
@@ -286,22 +305,11 @@ class TestSSHConnector(TestCase):
         ) as fake_rsa_key_open, patch(
             "pyinfra.connectors.ssh_util.DSSKey.from_private_key_file",
         ) as fake_dss_key_open:  # noqa
-
-            def fake_rsa_key_open_fail(*args, **kwargs):
-                if "password" not in kwargs:
-                    raise PasswordRequiredException
-                raise SSHException
-
-            fake_rsa_key_open.side_effect = fake_rsa_key_open_fail
+            fake_rsa_key_open.side_effect = reject_key_password
 
             fake_dss_key = MagicMock()
-
-            def fake_dss_key_func(*args, **kwargs):
-                if "password" not in kwargs:
-                    raise PasswordRequiredException
-                return fake_dss_key
-
-            fake_dss_key_open.side_effect = fake_dss_key_func
+            fake_dss_key_open.side_effect = require_key_password
+            fake_dss_key_open.return_value = fake_dss_key
 
             connect_all(state)
 
@@ -324,41 +332,40 @@ class TestSSHConnector(TestCase):
             )
 
         # Check that loading the same key again is cached in the state
-        second_state = State(
-            make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)),
-            Config(),
-        )
+        second_state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
         second_state.private_keys = state.private_keys
 
         connect_all(second_state)
 
     def test_connect_with_missing_ssh_key(self):
-        state = State(make_inventory(hosts=(("somehost", {"ssh_key": "testkey"}),)), Config())
+        state = make_state(hosts=(("somehost", {"ssh_key": "testkey"}),))
 
         with self.assertRaises(PyinfraError) as e:
             connect_all(state)
 
         self.assertTrue(e.exception.args[0].startswith("No such private key file:"))
 
+
+@patch("pyinfra.connectors.ssh.open", mock_open(read_data="test!"), create=True)
+@patch("pyinfra.connectors.ssh.SFTPClient", new_callable=MagicMock)
+@patch("pyinfra.connectors.ssh.SSHClient", new_callable=MagicMock)
+class TestSSHConnectorCommands(TestCase):
     # SSH command tests
     #
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    def test_run_shell_command(self, fake_ssh_client):
-        fake_ssh = MagicMock()
+    def test_run_shell_command(self, fake_ssh_client, fake_sftp_client):
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
         fake_stdin = MagicMock()
-        fake_stdout = MagicMock()
+        fake_stdout = make_stdout_mock(0)
         fake_ssh.exec_command.return_value = fake_stdin, fake_stdout, MagicMock()
 
         fake_ssh_client.return_value = fake_ssh
 
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
         command = "echo Šablony"
-        fake_stdout.channel.recv_exit_status.return_value = 0
 
         out = host.run_shell_command(command, _stdin="hello", print_output=True)
         assert len(out) == 2
@@ -377,21 +384,18 @@ class TestSSHConnector(TestCase):
         fake_ssh.exec_command.assert_called_with("sh -c 'echo Šablony'", get_pty=False)
 
     @patch("pyinfra.connectors.ssh.click")
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    def test_run_shell_command_masked(self, fake_ssh_client, fake_click):
-        fake_ssh = MagicMock()
-        fake_stdout = MagicMock()
+    def test_run_shell_command_masked(self, fake_click, fake_ssh_client, fake_sftp_client):
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
+        fake_stdout = make_stdout_mock(0)
         fake_ssh.exec_command.return_value = MagicMock(), fake_stdout, MagicMock()
 
         fake_ssh_client.return_value = fake_ssh
 
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
         command = StringCommand("echo", MaskString("top-secret-stuff"))
-        fake_stdout.channel.recv_exit_status.return_value = 0
 
         out = host.run_shell_command(command, print_output=True, print_input=True)
         assert len(out) == 2
@@ -409,57 +413,52 @@ class TestSSHConnector(TestCase):
             err=True,
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    def test_run_shell_command_success_exit_code(self, fake_ssh_client):
-        fake_ssh = MagicMock()
-        fake_stdout = MagicMock()
+    def test_run_shell_command_success_exit_code(self, fake_ssh_client, fake_sftp_client):
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
+        fake_stdout = make_stdout_mock(1)
         fake_ssh.exec_command.return_value = MagicMock(), fake_stdout, MagicMock()
 
         fake_ssh_client.return_value = fake_ssh
 
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
         command = "echo hi"
-        fake_stdout.channel.recv_exit_status.return_value = 1
 
         out = host.run_shell_command(command, _success_exit_codes=[1])
         assert len(out) == 2
         assert out[0] is True
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    def test_run_shell_command_error(self, fake_ssh_client):
-        fake_ssh = MagicMock()
-        fake_stdout = MagicMock()
+    def test_run_shell_command_error(self, fake_ssh_client, fake_sftp_client):
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
+        fake_stdout = make_stdout_mock(1)
         fake_ssh.exec_command.return_value = MagicMock(), fake_stdout, MagicMock()
 
         fake_ssh_client.return_value = fake_ssh
 
-        inventory = make_inventory(hosts=("somehost",))
-        state = State(inventory, Config())
+        state = make_state(hosts=("somehost",))
+        inventory = state.inventory
         host = inventory.get_host("somehost")
         host.connect(state)
 
         command = "echo hi"
-        fake_stdout.channel.recv_exit_status.return_value = 1
 
         out = host.run_shell_command(command)
         assert len(out) == 2
         assert out[0] is False
 
     @patch("pyinfra.connectors.util.getpass")
-    @patch("pyinfra.connectors.ssh.SSHClient")
     def test_run_shell_command_sudo_password_automatic_prompt(
         self,
-        fake_ssh_client,
         fake_getpass,
+        fake_ssh_client,
+        fake_sftp_client,
     ):
-        fake_ssh = MagicMock()
-        first_fake_stdout = MagicMock()
-        second_fake_stdout = MagicMock()
-        third_fake_stdout = MagicMock()
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
+        first_fake_stdout = make_stdout_mock(1)
+        second_fake_stdout = make_stdout_mock(0)
+        third_fake_stdout = make_stdout_mock(0)
 
         first_fake_stdout.__iter__.return_value = ["sudo: a password is required\r"]
         second_fake_stdout.__iter__.return_value = ["/tmp/pyinfra-sudo-askpass-XXXXXXXXXXXX"]
@@ -473,15 +472,11 @@ class TestSSHConnector(TestCase):
         fake_ssh_client.return_value = fake_ssh
         fake_getpass.return_value = "password"
 
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
         command = "echo Šablony"
-        first_fake_stdout.channel.recv_exit_status.return_value = 1
-        second_fake_stdout.channel.recv_exit_status.return_value = 0
-        third_fake_stdout.channel.recv_exit_status.return_value = 0
 
         out = host.run_shell_command(command, _sudo=True, print_output=True)
         assert len(out) == 2
@@ -501,16 +496,16 @@ class TestSSHConnector(TestCase):
         )
 
     @patch("pyinfra.connectors.util.getpass")
-    @patch("pyinfra.connectors.ssh.SSHClient")
     def test_run_shell_command_sudo_password_automatic_prompt_with_special_chars_in_password(
         self,
-        fake_ssh_client,
         fake_getpass,
+        fake_ssh_client,
+        fake_sftp_client,
     ):
-        fake_ssh = MagicMock()
-        first_fake_stdout = MagicMock()
-        second_fake_stdout = MagicMock()
-        third_fake_stdout = MagicMock()
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
+        first_fake_stdout = make_stdout_mock(1)
+        second_fake_stdout = make_stdout_mock(0)
+        third_fake_stdout = make_stdout_mock(0)
 
         first_fake_stdout.__iter__.return_value = ["sudo: a password is required\r"]
         second_fake_stdout.__iter__.return_value = ["/tmp/pyinfra-sudo-askpass-XXXXXXXXXXXX"]
@@ -524,15 +519,11 @@ class TestSSHConnector(TestCase):
         fake_ssh_client.return_value = fake_ssh
         fake_getpass.return_value = "p@ss'word';"
 
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
         command = "echo Šablony"
-        first_fake_stdout.channel.recv_exit_status.return_value = 1
-        second_fake_stdout.channel.recv_exit_status.return_value = 0
-        third_fake_stdout.channel.recv_exit_status.return_value = 0
 
         out = host.run_shell_command(command, _sudo=True, print_output=True)
         assert len(out) == 2
@@ -554,16 +545,16 @@ class TestSSHConnector(TestCase):
     # SSH file put/get tests
     #
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
     @patch("pyinfra.connectors.util.getpass")
     def test_run_shell_command_retry_for_sudo_password(
         self,
         fake_getpass,
         fake_ssh_client,
+        fake_sftp_client,
     ):
         fake_getpass.return_value = "PASSWORD"
 
-        fake_ssh = MagicMock()
+        fake_ssh = MagicMock(spec_set=SSH_CLIENT_SPEC)
         fake_stdin = MagicMock()
         fake_stdout = MagicMock()
         fake_stderr = ["sudo: a password is required"]
@@ -571,8 +562,8 @@ class TestSSHConnector(TestCase):
 
         fake_ssh_client.return_value = fake_ssh
 
-        inventory = make_inventory(hosts=("somehost",))
-        state = State(inventory, Config())
+        state = make_state(hosts=("somehost",))
+        inventory = state.inventory
         host = inventory.get_host("somehost")
         host.connect(state)
         host.connector_data["sudo_askpass_path"] = "/tmp/pyinfra-sudo-askpass-XXXXXXXXXXXX"
@@ -594,11 +585,8 @@ class TestSSHConnector(TestCase):
     # SSH file put/get tests
     #
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
@@ -616,16 +604,12 @@ class TestSSHConnector(TestCase):
             "not-another-file",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file_sudo(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file_sudo(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 0
+        stdout_mock = make_stdout_mock(0)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -645,18 +629,18 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "sh -c 'setfacl -m u:ubuntu:r "
-                        "/tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24'"
+                        "/tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0'"
                     ),
                     get_pty=False,
                 ),
                 call(
                     (
-                        "sudo -H -n -u ubuntu sh -c 'cp /tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24 '\"'\"'not another file'\"'\"''"  # noqa: E501
+                        "sudo -H -n -u ubuntu sh -c 'cp /tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0 '\"'\"'not another file'\"'\"''"  # noqa: E501
                     ),
                     get_pty=False,
                 ),
                 call(
-                    ("sh -c 'rm -f /tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24'"),
+                    ("sh -c 'rm -f /tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0'"),
                     get_pty=False,
                 ),
             ],
@@ -664,19 +648,15 @@ class TestSSHConnector(TestCase):
 
         fake_sftp_client.from_transport().putfo.assert_called_with(
             fake_open(),
-            "/tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24",
+            "/tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file_doas(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file_doas(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 0
+        stdout_mock = make_stdout_mock(0)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -696,18 +676,18 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "sh -c 'setfacl -m u:ubuntu:r "
-                        "/tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24'"
+                        "/tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0'"
                     ),
                     get_pty=False,
                 ),
                 call(
                     (
-                        "doas -n -u ubuntu sh -c 'cp /tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24 '\"'\"'not another file'\"'\"''"  # noqa: E501
+                        "doas -n -u ubuntu sh -c 'cp /tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0 '\"'\"'not another file'\"'\"''"  # noqa: E501
                     ),
                     get_pty=False,
                 ),
                 call(
-                    ("sh -c 'rm -f /tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24'"),
+                    ("sh -c 'rm -f /tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0'"),
                     get_pty=False,
                 ),
             ],
@@ -715,19 +695,15 @@ class TestSSHConnector(TestCase):
 
         fake_sftp_client.from_transport().putfo.assert_called_with(
             fake_open(),
-            "/tmp/pyinfra-de01e82cb691e8a31369da3c7c8f17341c44ac24",
+            "/tmp/pyinfra-b11cb108c2689773e96ae674e15fc85423f233e0",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file_su_user_fail_acl(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file_su_user_fail_acl(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 1
+        stdout_mock = make_stdout_mock(1)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -744,21 +720,18 @@ class TestSSHConnector(TestCase):
         fake_ssh_client().exec_command.assert_called_with(
             (
                 "sh -c 'setfacl -m u:centos:r "
-                "/tmp/pyinfra-43db9984686317089fefcf2e38de527e4cb44487'"
+                "/tmp/pyinfra-a6c4c4f1681741a648e182828393dfb07f5384fe'"
             ),
             get_pty=False,
         )
 
         fake_sftp_client.from_transport().putfo.assert_called_with(
             fake_open(),
-            "/tmp/pyinfra-43db9984686317089fefcf2e38de527e4cb44487",
+            "/tmp/pyinfra-a6c4c4f1681741a648e182828393dfb07f5384fe",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file_su_user_fail_copy(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file_su_user_fail_copy(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
@@ -781,7 +754,7 @@ class TestSSHConnector(TestCase):
         fake_ssh_client().exec_command.assert_any_call(
             (
                 "sh -c 'setfacl -m u:centos:r "
-                "/tmp/pyinfra-43db9984686317089fefcf2e38de527e4cb44487'"
+                "/tmp/pyinfra-a6c4c4f1681741a648e182828393dfb07f5384fe'"
             ),
             get_pty=False,
         )
@@ -789,7 +762,7 @@ class TestSSHConnector(TestCase):
         fake_ssh_client().exec_command.assert_called_with(
             (
                 "su centos -c 'sh -c '\"'\"'cp "
-                "/tmp/pyinfra-43db9984686317089fefcf2e38de527e4cb44487 "
+                "/tmp/pyinfra-a6c4c4f1681741a648e182828393dfb07f5384fe "
                 "not-another-file'\"'\"''"
             ),
             get_pty=False,
@@ -797,19 +770,15 @@ class TestSSHConnector(TestCase):
 
         fake_sftp_client.from_transport().putfo.assert_called_with(
             fake_open(),
-            "/tmp/pyinfra-43db9984686317089fefcf2e38de527e4cb44487",
+            "/tmp/pyinfra-a6c4c4f1681741a648e182828393dfb07f5384fe",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_put_file_sudo_custom_temp_file(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_put_file_sudo_custom_temp_file(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 0
+        stdout_mock = make_stdout_mock(0)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -835,11 +804,8 @@ class TestSSHConnector(TestCase):
             "/a-different-tempfile",
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_get_file(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+    def test_get_file(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
@@ -857,16 +823,12 @@ class TestSSHConnector(TestCase):
             fake_open(),
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_get_file_sudo(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+    def test_get_file_sudo(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 0
+        stdout_mock = make_stdout_mock(0)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -886,14 +848,14 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "sudo -H -n -u ubuntu sh -c 'cp not-a-file "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508 && chmod +r /tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'"  # noqa
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1 && chmod +r /tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'"  # noqa
                     ),
                     get_pty=False,
                 ),
                 call(
                     (
                         "sudo -H -n -u ubuntu sh -c 'rm -f "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'"
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'"
                     ),
                     get_pty=False,
                 ),
@@ -901,19 +863,16 @@ class TestSSHConnector(TestCase):
         )
 
         fake_sftp_client.from_transport().getfo.assert_called_with(
-            "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508",
+            "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1",
             fake_open(),
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    def test_get_file_sudo_copy_fail(self, fake_ssh_client):
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+    def test_get_file_sudo_copy_fail(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 1
+        stdout_mock = make_stdout_mock(1)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         status = host.get_file(
@@ -931,18 +890,15 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "sudo -H -n -u ubuntu sh -c 'cp not-a-file "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508 && chmod +r /tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'"  # noqa
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1 && chmod +r /tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'"  # noqa
                     ),
                     get_pty=False,
                 ),
             ],
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_get_file_sudo_remove_fail(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+    def test_get_file_sudo_remove_fail(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
@@ -967,14 +923,14 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "sudo -H -n -u ubuntu sh -c 'cp not-a-file "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508 && chmod +r /tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'"  # noqa
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1 && chmod +r /tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'"  # noqa
                     ),
                     get_pty=False,
                 ),
                 call(
                     (
                         "sudo -H -n -u ubuntu sh -c 'rm -f "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'"
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'"
                     ),
                     get_pty=False,
                 ),
@@ -982,20 +938,16 @@ class TestSSHConnector(TestCase):
         )
 
         fake_sftp_client.from_transport().getfo.assert_called_with(
-            "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508",
+            "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1",
             fake_open(),
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_get_file_su_user(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("somehost",))
-        State(inventory, Config())
+    def test_get_file_su_user(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("somehost",)).inventory
         host = inventory.get_host("somehost")
         host.connect()
 
-        stdout_mock = MagicMock()
-        stdout_mock.channel.recv_exit_status.return_value = 0
+        stdout_mock = make_stdout_mock(0)
         fake_ssh_client().exec_command.return_value = MagicMock(), stdout_mock, MagicMock()
 
         fake_open = mock_open(read_data="test!")
@@ -1014,15 +966,15 @@ class TestSSHConnector(TestCase):
                 call(
                     (
                         "su centos -c 'sh -c '\"'\"'cp not-a-file "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508 && chmod +r "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'\"'\"''"
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1 && chmod +r "
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'\"'\"''"
                     ),
                     get_pty=False,
                 ),
                 call(
                     (
                         "su centos -c 'sh -c '\"'\"'rm -f "
-                        "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508'\"'\"''"
+                        "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1'\"'\"''"
                     ),
                     get_pty=False,
                 ),
@@ -1030,19 +982,16 @@ class TestSSHConnector(TestCase):
         )
 
         fake_sftp_client.from_transport().getfo.assert_called_with(
-            "/tmp/pyinfra-e9c0d3c8ffca943daa0e75511b0a09c84b59c508",
+            "/tmp/pyinfra-e59a56e3683811f6749a9982353a51cbbf2a5ca1",
             fake_open(),
         )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
-    @patch("pyinfra.connectors.ssh.SFTPClient")
-    def test_get_sftp_fail(self, fake_sftp_client, fake_ssh_client):
-        inventory = make_inventory(hosts=("anotherhost",))
-        State(inventory, Config())
+    def test_get_sftp_fail(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
         host = inventory.get_host("anotherhost")
         host.connect()
 
-        fake_sftp_client.from_transport.side_effect = make_raise_exception_function(SSHException)
+        fake_sftp_client.from_transport.side_effect = SSHException
 
         fake_open = mock_open(read_data="test!")
         with patch("pyinfra.api.util.open", fake_open, create=True):
@@ -1053,9 +1002,45 @@ class TestSSHConnector(TestCase):
                     print_output=True,
                 )
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
+    def test_sftp_connection_reused(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
+        host = inventory.get_host("anotherhost")
+        host.connect()
+
+        fake_open = mock_open(read_data="test!")
+        with patch("pyinfra.api.util.open", fake_open, create=True):
+            host.put_file("not-a-file", "not-another-file")
+            host.get_file("not-another-file", "not-a-file")
+
+        fake_sftp_client.from_transport.assert_called_once()
+        sftp = fake_sftp_client.from_transport.return_value
+        assert sftp.putfo.call_count == 1
+        assert sftp.getfo.call_count == 1
+
+        host.disconnect()
+        sftp.close.assert_called_once()
+
+        host.connect()
+        with patch("pyinfra.api.util.open", fake_open, create=True):
+            host.put_file("not-a-file", "not-another-file")
+
+        assert fake_sftp_client.from_transport.call_count == 2
+
+    def test_sftp_close_fail(self, fake_ssh_client, fake_sftp_client):
+        inventory = make_state(hosts=("anotherhost",)).inventory
+        host = inventory.get_host("anotherhost")
+        host.connect()
+
+        fake_open = mock_open(read_data="test!")
+        with patch("pyinfra.api.util.open", fake_open, create=True):
+            host.put_file("not-a-file", "not-another-file")
+
+        fake_sftp_client.from_transport.return_value.close.side_effect = EOFError
+        host.disconnect()
+        assert host.connector.sftp is None
+
     @patch("pyinfra.connectors.ssh.sleep")
-    def test_ssh_connect_fail_retry(self, fake_sleep, fake_ssh_client):
+    def test_ssh_connect_fail_retry(self, fake_sleep, fake_ssh_client, fake_sftp_client):
         for exception_class in (
             SSHException,
             gaierror,
@@ -1065,10 +1050,9 @@ class TestSSHConnector(TestCase):
             fake_sleep.reset_mock()
             fake_ssh_client.reset_mock()
 
-            inventory = make_inventory(
+            inventory = make_state(
                 hosts=("unresposivehost",), override_data={"ssh_connect_retries": 1}
-            )
-            State(inventory, Config())
+            ).inventory
 
             unresposivehost = inventory.get_host("unresposivehost")
             assert unresposivehost.data.ssh_connect_retries == 1
@@ -1081,9 +1065,8 @@ class TestSSHConnector(TestCase):
             fake_sleep.assert_called_once()
             assert fake_ssh_client().connect.call_count == 2
 
-    @patch("pyinfra.connectors.ssh.SSHClient")
     @patch("pyinfra.connectors.ssh.sleep")
-    def test_ssh_connect_fail_success(self, fake_sleep, fake_ssh_client):
+    def test_ssh_connect_fail_success(self, fake_sleep, fake_ssh_client, fake_sftp_client):
         for exception_class in (
             SSHException,
             gaierror,
@@ -1093,10 +1076,9 @@ class TestSSHConnector(TestCase):
             fake_sleep.reset_mock()
             fake_ssh_client.reset_mock()
 
-            inventory = make_inventory(
+            inventory = make_state(
                 hosts=("unresposivehost",), override_data={"ssh_connect_retries": 1}
-            )
-            State(inventory, Config())
+            ).inventory
 
             unresposivehost = inventory.get_host("unresposivehost")
             assert unresposivehost.data.ssh_connect_retries == 1
@@ -0,0 +1,98 @@
+import re
+from unittest import TestCase
+from unittest.mock import patch
+
+from pyinfra.facts.apk import ApkPackages
+from pyinfra.facts.rpm import RpmPackages
+from pyinfra.facts.util.packaging import PackagesView, _scan_packages, parse_packages
+
+
+class TestParsePackages(TestCase):
+    output = ["bash 5.1.8", "glibc 2.34"]
+    packages = {"bash": {"5.1.8"}, "glibc": {"2.34"}}
+
+    def test_multiline(self):
+        regex = re.compile(r"^(\S+) (\S+)$", re.MULTILINE)
+        assert parse_packages(regex, self.output) == self.packages
+
+    def test_multiline_extra_groups(self):
+        regex = re.compile(r"^(\S+) (\S+)()$", re.MULTILINE)
+        assert parse_packages(regex, self.output) == self.packages
+
+    def test_per_line(self):
+        assert parse_packages(r"^(\S+) (\S+)$", self.output) == self.packages
+
+
+class TestPackagesView(TestCase):
+    def setUp(self):
+        self.packages = PackagesView(
+            {
+                "musl": {"1.2.3-r4", "1.2.3-r5"},
+                "busybox": {"1.35.0-r17"},
+            },
+        )
+
+    def test_mapping(self):
+        assert len(self.packages) == 2
+        assert list(self.packages) == ["musl", "busybox"]
+        assert self.packages["musl"] == {"1.2.3-r4", "1.2.3-r5"}
+        assert "busybox" in self.packages
+        assert "zlib" not in self.packages
+
+    def test_missing_package(self):
+        with self.assertRaises(KeyError):
+            self.packages["zlib"]
+
+    def test_to_dict(self):
+        packages = self.packages.to_dict()
+        assert packages == {
+            "musl": {"1.2.3-r4", "1.2.3-r5"},
+            "busybox": {"1.35.0-r17"},
+        }
+        assert list(packages) == ["musl", "busybox"]
+
+        # Each call returns a new dict that can be freely modified
+        packages["musl"].add("1.2.4-r0")
+        assert self.packages.to_dict()["musl"] == {"1.2.3-r4", "1.2.3-r5"}
+
+
+class TestPackagesCache(TestCase):
+    def test_apk_packages(self):
+        output = [
+            "musl-1.2.3-r4 x86_64 {musl} (MIT) [installed]",
+            "zlib-1.2.13-r0 x86_64 {zlib} (Zlib) [installed]",
+            "WARNING: Ignoring APKINDEX.66df3ce9.tar.gz: No such file or directory",
+        ]
+        with patch(
+            "pyinfra.facts.util.packaging._scan_packages",
+            wraps=_scan_packages,
+        ) as fake_scan_packages:
+            first = ApkPackages().process(output)
+            second = ApkPackages().process(list(output))
+
+        # The second host's output is served from the cache
+        fake_scan_packages.assert_called_once()
+
+        # Hosts with identical output each get their own dict
+        first["musl"].add("1.2.4-r0")
+        first["busybox"] = {"1.35.0-r17"}
+        assert second == {"musl": {"1.2.3-r4"}, "zlib": {"1.2.13-r0"}}
+
+    def test_rpm_packages(self):
+        output = ["glibc 2.34-60.el9", "bash 5.1.8-6.el9"]
+        with patch(
+            "pyinfra.facts.util.packaging._scan_packages",
+            wraps=_scan_packages,
+        ) as fake_scan_packages:
+            first = RpmPackages().process(output)
+            second = RpmPackages().process(list(output))
+
+        # The second host's output is served from the cache
+        fake_scan_packages.assert_called_once()
+
+        # Hosts with identical output each get their own dict
+        first["bash"].add("5.2.15-1.el9")
+        first["zlib"] = {"1.2.11-40.el9"}
+        assert second == {"bash": {"5.1.8-6.el9"}, "glibc": {"2.34-60.el9"}}
+        # Packages keep the order of the output
+        assert list(second) == ["glibc", "bash"]
@@ -1,5 +1,6 @@
 import json
 import os
+from copy import copy
 from datetime import datetime
 from inspect import getfullargspec
 from io import open
@@ -7,7 +8,7 @@ from os import listdir, path
 from pathlib import Path
 from unittest.mock import patch
 
-from pyinfra.api import Config, Inventory
+from pyinfra.api import Config, Inventory, State
 from pyinfra.api.util import get_kwargs_str
 
 
@@ -39,6 +40,20 @@ def make_inventory(hosts=("somehost", "anotherhost"), **kwargs):
     )
 
 
+BASE_CONFIG = Config()
+
+
+def make_state(hosts=("somehost", "anotherhost"), **kwargs):
+    """
+    Make a ``State`` for a test inventory (see ``make_inventory``). The state gets a copy
+    of a shared default config, as ``State`` modifies the config it's given.
+    """
+
+    config = copy(BASE_CONFIG)
+    config.ENV = BASE_CONFIG.ENV.copy()
+    return State(make_inventory(hosts=hosts, **kwargs), config)
+
+
 class FakeState:
     active = True
     cwd = "/"